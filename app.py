@@ -1,14 +1,25 @@
 # app.py
 
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException,   Depends, Security
-import json
+import asyncio
+from contextlib import asynccontextmanager
+import orjson
 from fastapi.openapi.docs import get_swagger_ui_html
+from fastapi.responses import ORJSONResponse
 from fastapi.security.api_key import APIKeyHeader
 from typing import List, Optional
+import logging
 import os
 
-from utils import extract_text, process_files, generate_excel_report
+from utils import extract_text, process_files, generate_excel_report, start_pdf_pool, shutdown_pdf_pool
 from llm import LLM
+from cache import CandidateCache
+from prompts import (
+    EXTRACTION_SYSTEM_PROMPT, EXTRACT_PROMPT_TEMPLATE, ADDITIONAL_CRITERIA_TEMPLATE,
+    SCORING_SYSTEM_PROMPT, SCORE_PROMPT_PREFIX
+)
+
+logger = logging.getLogger(__name__)
 
 # Load API key from environment variable (stored in Azure)
 API_KEY = os.getenv("API_SECRET_KEY")
@@ -34,6 +45,48 @@ def get_api_key(api_key: str = Security(api_key_header)):
 
 llm_analyzer = LLM()
 
+# Cap the number of in-flight LLM calls to stay within provider rate limits
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "8"))
+llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+
+# Scores per (job title + criteria, resume). Matching similar rather than identical
+# resumes is opt-in: set CANDIDATE_CACHE_SIMILARITY (e.g. 0.97) to enable it.
+_similarity = os.getenv("CANDIDATE_CACHE_SIMILARITY")
+candidate_cache = CandidateCache(
+    path=os.getenv("LLM_CACHE_PATH"),
+    ttl=int(os.getenv("LLM_CACHE_TTL", "86400")),
+    similarity=float(_similarity) if _similarity else None
+)
+
+
+
+def check_criteria(criteria_data):
+    """Raise ValueError unless a parsed extraction response holds a criteria list."""
+    if not isinstance(criteria_data, dict) or not isinstance(criteria_data.get("criteria"), list):
+        raise ValueError("LLM response is not in the expected format")
+
+
+def score_total(criteria_data):
+    """Validate a parsed scoring response and return its total score."""
+    if not isinstance(criteria_data, dict):
+        raise ValueError("LLM response is not in the expected format")
+
+    scores = criteria_data.get("scores", [])
+    if not isinstance(scores, list) or not all(isinstance(score_item, dict) for score_item in scores):
+        raise ValueError("LLM response is not in the expected format")
+    return sum(score_item.get("score", 0) for score_item in scores)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Start PDF workers with the app rather than on the first large upload
+    start_pdf_pool()
+    try:
+        yield
+    finally:
+        shutdown_pdf_pool()
+
+
 app = FastAPI(
     title="Resume Scoring API",
     description="""
@@ -58,6 +111,8 @@ app = FastAPI(
     openapi_url="/openapi.json",
     docs_url="/docs",  
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
     debug=True
 )
 
@@ -92,68 +147,25 @@ async def extract_job_criteria(
     # Validate file extension using .endswith()
     filename_lower = (file.filename or "").lower()  
 
-    if not file.filename.lower().endswith((".pdf", ".docx")):
+    if not filename_lower.endswith((".pdf", ".docx")):
         raise HTTPException(status_code=400, detail="Only PDF and DOCX files are supported")
 
     file_extension = filename_lower[filename_lower.rfind("."):]
 
-    # Read file content
-    file_content = await file.read()
-    
-    # Extract text from file
-    job_description_text = extract_text(file_content, file_extension)
-
-    system_prompt = "You are an expert HR specialist who scans job descriptions and resumes to extract information and score candidates."
+    # Extract text straight from the upload's spooled temporary file
+    job_description_text = await asyncio.to_thread(extract_text, file.file, file_extension)
 
     additional_criteria_text = ""
     if additional_criteria:
-        additional_criteria_text = f"""
-        I have also included the following additional criteria that you should consider in your analysis. 
-        You must integrate these with the criteria from the job description that you have extracted:
-        
-        {additional_criteria}
-        """
-
-    
-    prompt = f"""
-    You are an expert HR recruiter tasked with extracting the key evaluation criteria from job descriptions.
-
-    Your task is to identify the MOST IMPORTANT ranking criteria that would be used to evaluate and score candidates. Focus on extracting 5-12 KEY criteria that truly differentiate candidates for this role.
-
-    IMPORTANT GUIDELINES:
-    1. Focus on the CORE requirements of the role - what skills/qualifications are truly essential
-    2. Keep different technologies separate (e.g., Python, SQL, AWS)
-    3. Group related soft skills appropriately (don't create too many separate criteria)
-    4. Include specific education/experience requirements as stated
-    5. Prioritize technical skills and domain knowledge over generic abilities
-    6. Avoid excessive granularity - too many criteria dilute the importance of each
-
-    DO NOT include:
-    - General job descriptions or responsibilities
-    - Workplace benefits or policies
-    - Physical work environment descriptions
-    - Employment terms/conditions
-    - Repetitive criteria that measure essentially the same skill
+        additional_criteria_text = ADDITIONAL_CRITERIA_TEMPLATE.format(additional_criteria=additional_criteria)
 
-    Format your response as a JSON object with a single key 'criteria' that contains an array of strings, where each string is a separate criterion. List them in order of importance to the role.
-
-
-    Examples of BAD criteria (too consolidated):
-    - "Experience with Python, SQL, AWS, Excel, and PowerPoint"
-    - "Strong communication and presentation skills"
-
-    {additional_criteria_text}
-
-    Here is the job description:
-
-    {job_description_text}
-    """
+    prompt = EXTRACT_PROMPT_TEMPLATE.format(additional=additional_criteria_text, jd=job_description_text)
     try:
         
-        llm_response = llm_analyzer.json_prompt(system_prompt,prompt)
+        llm_response = await llm_analyzer.json_prompt(EXTRACTION_SYSTEM_PROMPT, prompt, validate=check_criteria)
         # Parse the JSON string into a Python dictionary
         if isinstance(llm_response, str):
-            return json.loads(llm_response)
+            return orjson.loads(llm_response)
         return llm_response
         
     except Exception as e:
@@ -201,20 +213,76 @@ async def score_resumes(
     if not files:
         raise HTTPException(status_code=400, detail="No resume files provided")
     
-    # Load API configuration
-    try:
-        llm_analyzer = LLM()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error loading configuration: {str(e)}")
-    
     # Format criteria for prompt
     criteria_formatted = "\n".join([f"- {c}" for c in criteria])
 
     processed_files = await process_files(files)
     
-    # Analyze each resume only after all files are processed
+    # Everything but the resume text is shared by the whole batch, so build it once
+    prompt_prefix = SCORE_PROMPT_PREFIX.format(
+        job_title=job_title if job_title else "Not specified",
+        criteria=criteria_formatted
+    )
+
+    # Changing the models or the scoring prompts invalidates earlier scores
+    criteria_key = CandidateCache.make_criteria_key(
+        job_title, criteria, llm_analyzer.model_names, SCORING_SYSTEM_PROMPT + "\x00" + SCORE_PROMPT_PREFIX)
+
+    async def fetch_scores(processed_file):
+        """Get the parsed LLM scores for one resume, from the cache or the LLM."""
+        # Prepare prompt for LLM
+        prompt = prompt_prefix + processed_file["resume_text"]
+
+        # Reuse earlier scores for this resume and criteria, otherwise ask the LLM
+        resume_key = CandidateCache.make_resume_key(processed_file["resume_text"])
+        json_response = await candidate_cache.aget(criteria_key, resume_key)
+
+        embedding = None
+        similar_hit = False
+        if json_response is None and candidate_cache.similarity is not None:
+            try:
+                async with llm_semaphore:
+                    embedding = await llm_analyzer.embed(processed_file["resume_text"])
+                json_response = await candidate_cache.aget(criteria_key, resume_key, embedding)
+                similar_hit = json_response is not None
+            except Exception as e:
+                logger.warning("Embedding failed for %s: %s", processed_file['filename'], e)
+
+        from_cache = json_response is not None
+        if not from_cache:
+            # Get the JSON string response from the LLM
+            async with llm_semaphore:
+                json_response = await llm_analyzer.json_prompt(
+                    SCORING_SYSTEM_PROMPT, prompt, cache_key=job_title, validate=score_total)
+            logger.debug("Received response for %s", processed_file['filename'])
+
+        # Parse the JSON string to a Python dictionary
+        criteria_data = orjson.loads(json_response)
+
+        # Validate response format
+        total_score = score_total(criteria_data)
+
+        # Scores borrowed from a similar resume carry that resume's name; use the filename instead
+        if similar_hit:
+            criteria_data.pop("candidate_name", None)
+
+        if not from_cache:
+            await candidate_cache.aset(criteria_key, resume_key, json_response, embedding)
+        return criteria_data, total_score
+
+    # Score each distinct resume once, concurrently; duplicate uploads share the result
+    unique_files = {}
+    for processed_file in processed_files:
+        if "error" not in processed_file:
+            unique_files.setdefault(processed_file["content_hash"], processed_file)
+
+    outcomes = await asyncio.gather(
+        *(fetch_scores(processed_file) for processed_file in unique_files.values()),
+        return_exceptions=True
+    )
+    outcomes_by_hash = dict(zip(unique_files, outcomes))
+
     results = []
-    
     for processed_file in processed_files:
         # Skip files with processing errors
         if "error" in processed_file:
@@ -223,100 +291,30 @@ async def score_resumes(
                 "Error": processed_file["error"]
             })
             continue
-            
-        # Prepare prompt for LLM
-        job_context = f"for a {job_title} position" if job_title else "for this position"
-        
-        prompt = f"""
-        You are a technical recruiter evaluating candidates {job_context}. Analyze the provided resume against the following job criteria.
-
-        For each criterion, assign a score from 0 to 5 where:
-        - 0: No evidence of the criterion in the resume
-        - 1: Minimal/indirect evidence or very weak match
-        - 2: Some evidence but limited or tangential experience/qualification
-        - 3: Moderate evidence showing relevant experience/qualification
-        - 4: Strong evidence of meeting the criterion with substantial experience
-        - 5: Excellent match, exceeding the criterion requirements with extensive experience
-
-        CRITICAL SCORING GUIDELINES:
-        1. The most important criteria for this role are directly related to the core technical and domain requirements of {job_title if job_title else "the role"}
-        2. Candidates without direct experience in the primary domain of {job_title if job_title else "the role"} should receive substantially lower overall scores
-        3. Generic transferable skills (like "communication") should not compensate for a lack of core technical requirements
-        4. Secondary or "nice to have" skills should not significantly impact the total score compared to essential skills
-        5. Require EXPLICIT evidence in the resume - do not assume skills based on job titles alone
-        6. For technical skills, look for specific mentions and practical application
-
-        Format your response as a JSON object with the candidate name and an array of scores, where each score is an object with the criterion and score value.
-
-        Here are the criteria:
-        {criteria_formatted}
-
-        Here is the resume text:
-        {processed_file["resume_text"]}
-
-        Example Output:
-        {{
-        "candidate_name": "John Doe",
-        "scores": [
-            {{
-            "criterion": "Experience with Python programming",
-            "score": 5,
-            "justification": "The candidate has 5+ years of Python development with specific projects including ML model development and data pipelines."
-            }},
-            {{
-            "criterion": "Experience with AWS cloud services",
-            "score": 0,
-            "justification": "No mention of AWS experience anywhere in the resume."
-            }}
-        ]
-        }}
-        """
-        
-        # Get scores from LLM
-        try:
-            # Enhanced system prompt that includes job title context
-            system_prompt = f"You are an expert technical recruiter specialized in evaluating candidates for {job_title if job_title else 'technical'} roles."
-            
-            # Get the JSON string response from the LLM
-            json_response = llm_analyzer.json_prompt(system_prompt, prompt)
-            print(f"Received response for {processed_file['filename']}")
-            
-            # Parse the JSON string to a Python dictionary
-            criteria_data = json.loads(json_response)
-            
-            # Validate response format
-            if not isinstance(criteria_data, dict):
-                raise ValueError("LLM response is not in the expected format")
-            
-            # Use the name extracted by the LLM, or fall back to the filename
-            llm_extracted_name = criteria_data.get("candidate_name", "")
-            candidate_result = {
-                "Candidate": llm_extracted_name if llm_extracted_name else processed_file["fallback_name"]
-            }
-            
-            # Extract scores for each criterion
-            total_score = 0
-            for score_item in criteria_data.get("scores", []):
-                criterion = score_item.get("criterion", "Unknown")
-                score = score_item.get("score", 0)
-                justification = score_item.get("justification", "")
-                
-                candidate_result[f"{criterion} (Score)"] = score
-                candidate_result[f"{criterion} (Justification)"] = justification
-                total_score += score
-            
-            candidate_result["Total Score"] = total_score
-            results.append(candidate_result)
-            
-        except Exception as e:
+
+        outcome = outcomes_by_hash[processed_file["content_hash"]]
+        if isinstance(outcome, BaseException):
             # Log the error but continue processing other resumes
-            print(f"Error analyzing {processed_file['filename']}: {str(e)}")
+            logger.warning("Error analyzing %s: %s", processed_file['filename'], outcome)
             # Add a placeholder result with error information
             results.append({
                 "Candidate": processed_file["fallback_name"],
-                "Error": f"Failed to analyze: {str(e)}"
+                "Error": f"Failed to analyze: {str(outcome)}"
             })
-    
+            continue
+
+        criteria_data, total_score = outcome
+
+        # Use the name extracted by the LLM, or fall back to the filename
+        llm_extracted_name = criteria_data.get("candidate_name", "")
+
+        # Scores stay structured; the report flattens them
+        results.append({
+            "Candidate": llm_extracted_name if llm_extracted_name else processed_file["fallback_name"],
+            "scores": criteria_data.get("scores", []),
+            "Total Score": total_score
+        })
+
     # Generate Excel report
     return generate_excel_report(results)        
         
@@ -0,0 +1,204 @@
+#cache.py
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "resume_scorer_cache.sqlite3")
+
+# Expired rows are deleted in bulk when a cache is opened and after this many writes
+PURGE_EVERY_WRITES = 100
+
+
+class _SqliteCache():
+    """Shared connection and locking for caches stored in a local sqlite file."""
+
+    schema = ""
+    table = ""
+
+    def __init__(self, path=None, ttl=86400):
+        self.path = path or DEFAULT_CACHE_PATH
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+
+    def _connection(self):
+        if self._conn is None:
+            # Cached responses hold candidate data, so keep the file private to this user
+            os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+            os.chmod(self.path, 0o600)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(self.schema)
+            self._purge_expired()
+        return self._conn
+
+    def _purge_expired(self):
+        """Delete every expired row; call with the lock held."""
+        with self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),))
+
+    def _count_write(self):
+        """Purge expired rows every PURGE_EVERY_WRITES writes; call with the lock held."""
+        self._writes += 1
+        if self._writes % PURGE_EVERY_WRITES == 0:
+            self._purge_expired()
+
+    async def aget(self, *args, **kwargs):
+        """Run get in a worker thread so sqlite I/O stays off the event loop."""
+        return await asyncio.to_thread(self.get, *args, **kwargs)
+
+    async def aset(self, *args, **kwargs):
+        """Run set in a worker thread so sqlite I/O stays off the event loop."""
+        return await asyncio.to_thread(self.set, *args, **kwargs)
+
+
+class ResponseCache(_SqliteCache):
+    """Exact-match cache of LLM responses stored in a local sqlite file."""
+
+    table = "responses"
+    schema = "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+
+    @staticmethod
+    def make_key(system_prompt, prompt, model=""):
+        """Hash the model names and full prompt pair into a cache key."""
+        return hashlib.sha256("\x00".join([str(model), str(system_prompt), str(prompt)]).encode("utf-8")).hexdigest()
+
+    def get(self, key) -> Optional[str]:
+        """Return the cached response for key, or None if missing or expired."""
+        if self.ttl <= 0:
+            return None
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                if row[1] < time.time():
+                    with conn:
+                        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                return row[0]
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Response cache read failed: %s", e)
+            return None
+
+    def set(self, key, value, ttl=None):
+        """Store value under key for ttl seconds (defaults to the cache ttl)."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, value, time.time() + ttl)
+                    )
+                self._count_write()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Response cache write failed: %s", e)
+
+
+class CandidateCache(_SqliteCache):
+    """Cache of a candidate's scores for a set of criteria.
+
+    Lookups match the resume text exactly, or, when a similarity threshold is
+    set and an embedding is given, the most similar cached resume scored
+    against the same criteria.
+    """
+
+    table = "candidates"
+    schema = (
+        "CREATE TABLE IF NOT EXISTS candidates ("
+        "criteria_key TEXT NOT NULL, resume_key TEXT NOT NULL, embedding BLOB, "
+        "scores TEXT NOT NULL, expires_at REAL NOT NULL, "
+        "PRIMARY KEY (criteria_key, resume_key))"
+    )
+
+    def __init__(self, path=None, ttl=86400, similarity=None):
+        super().__init__(path, ttl)
+        self.similarity = similarity
+
+    @staticmethod
+    def make_criteria_key(job_title, criteria, model="", prompt=""):
+        """Hash the model names, scoring prompt, job title and criteria, ignoring criteria order."""
+        parts = [str(model), str(prompt), str(job_title or "")] + sorted(str(c) for c in criteria)
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_resume_key(resume_text):
+        """Hash the resume text."""
+        return hashlib.sha256(str(resume_text).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, criteria_key, resume_key, embedding=None) -> Optional[str]:
+        """Return cached scores JSON for the resume, or None on a miss."""
+        if self.ttl <= 0:
+            return None
+        try:
+            with self._lock:
+                conn = self._connection()
+                now = time.time()
+                row = conn.execute(
+                    "SELECT scores FROM candidates WHERE criteria_key = ? AND resume_key = ? AND expires_at >= ?",
+                    (criteria_key, resume_key, now)
+                ).fetchone()
+                if row is not None:
+                    return row[0]
+
+                if embedding is None or self.similarity is None:
+                    return None
+
+                rows = conn.execute(
+                    "SELECT embedding, scores FROM candidates WHERE criteria_key = ? AND embedding IS NOT NULL AND expires_at >= ?",
+                    (criteria_key, now)
+                ).fetchall()
+            if not rows:
+                return None
+
+            # Brute-force cosine similarity over the stored, pre-normalized embeddings
+            matrix = np.vstack([np.frombuffer(r[0], dtype=np.float32) for r in rows])
+            similarities = matrix @ self._normalize(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity:
+                return rows[best][1]
+            return None
+        except (sqlite3.Error, OSError, ValueError) as e:
+            logger.warning("Candidate cache read failed: %s", e)
+            return None
+
+    def set(self, criteria_key, resume_key, scores, embedding=None):
+        """Store the scores JSON for the resume, with its embedding if given."""
+        if self.ttl <= 0:
+            return
+        blob = self._normalize(embedding).tobytes() if embedding is not None else None
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO candidates (criteria_key, resume_key, embedding, scores, expires_at) VALUES (?, ?, ?, ?, ?)",
+                        (criteria_key, resume_key, blob, scores, time.time() + self.ttl)
+                    )
+                self._count_write()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Candidate cache write failed: %s", e)
@@ -1,66 +1,157 @@
+import httpx
+import logging
 import openai
+import orjson
 import os
 
+from cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+# Shared across LLM instances so repeated prompts skip the provider round-trip
+response_cache = ResponseCache(
+    path=os.getenv("LLM_CACHE_PATH"),
+    ttl=int(os.getenv("LLM_CACHE_TTL", "86400"))
+)
+
+# One pooled HTTP/2 client shared by every provider so concurrent scoring calls reuse connections
+http_client = openai.DefaultAsyncHttpxClient(
+    timeout=httpx.Timeout(60.0, connect=5.0),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        retries=2  # connection failures only
+    )
+)
+
+# The SDK retries 408/409/429/5xx and connection errors with exponential backoff, never other 4xx
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# Keeps embedding input comfortably inside the model's token limit
+EMBEDDING_MAX_CHARS = 20000
+
+
+def canonicalize_prompt(text):
+    """Normalize newlines and strip trailing whitespace so identical prompts are byte-identical."""
+    lines = str(text).replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
 class LLM():
-    def json_prompt(self, system_prompt, prompt):
-        """Takes Prompts and returns JSON response, tries DeepSeek before OpenAI"""
-         
+    def __init__(self):
+        # Build provider clients once so their connection pools are reused across calls
+        self.ds_name = os.getenv("DS_NAME")
+        ds_api_key = os.getenv("DS_API_KEY")
+        ds_api_url = os.getenv("DS_API_URL")
+        self._ds_client = None
+        if all([ds_api_key, ds_api_url, self.ds_name]):
+            self._ds_client = openai.AsyncOpenAI(
+                api_key=ds_api_key,
+                base_url=ds_api_url,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=http_client,
+            )
+
+        self.openai_api_model = os.getenv("OPENAI_API_MODEL")
+        self.openai_embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        self._oai_client = None
+        if all([openai_api_key, self.openai_api_model]):
+            self._oai_client = openai.AsyncOpenAI(
+                api_key=openai_api_key,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=http_client,
+            )
+
+        # Part of every cache key, so switching models never serves the old model's answers
+        self.model_names = f"{self.ds_name or ''}\x00{self.openai_api_model or ''}"
+
+    async def embed(self, text):
+        """Return an OpenAI embedding of text, or None if OpenAI is not configured."""
+        if self._oai_client is None:
+            return None
+        response = await self._oai_client.embeddings.create(
+            model=self.openai_embedding_model,
+            input=str(text)[:EMBEDDING_MAX_CHARS]
+        )
+        return response.data[0].embedding
+
+    async def json_prompt(self, system_prompt, prompt, cache_key=None, validate=None):
+        """Takes Prompts and returns JSON response, tries DeepSeek before OpenAI
+
+        Responses are cached on a hash of the canonical prompts, so an identical
+        request is answered without calling a provider.
+
+        cache_key is forwarded to OpenAI as prompt_cache_key to group requests
+        sharing a prompt prefix; DeepSeek caches prefixes automatically.
+
+        validate, if given, is called with the parsed response and should raise
+        if it is unusable; only responses that pass are cached.
+        """
+        system_prompt = canonicalize_prompt(system_prompt)
+        prompt = canonicalize_prompt(prompt)
+
+        key = ResponseCache.make_key(system_prompt, prompt, self.model_names)
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            return cached
+
+        content = await self._complete(system_prompt, prompt, cache_key)
+
+        # Only keep responses that parse and validate, so a malformed reply is retried next time
+        try:
+            parsed = orjson.loads(content)
+            if validate is not None:
+                validate(parsed)
+        except Exception:
+            return content
+        await response_cache.aset(key, content)
+        return content
+
+    async def _complete(self, system_prompt, prompt, cache_key=None):
+        """Send the prompts to DeepSeek, falling back to OpenAI, and return the raw content."""
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+
         # Try DeepSeek First
         try:
-            ds_api_key = os.getenv("DS_API_KEY")
-            ds_api_url = os.getenv("DS_API_URL")
-            ds_name = os.getenv("DS_NAME")
-            
-            if not all([ds_api_key, ds_api_url, ds_name]):
+            if self._ds_client is None:
                 raise ValueError("Missing DeepSeek configuration environment variables")
-                
-            response = openai.OpenAI(
-                api_key=ds_api_key,
-                base_url=ds_api_url,
-            ).chat.completions.create(
-                model=ds_name,
-                messages=[
-                    {"role": "system", "content": str(system_prompt)},
-                    {"role": "user", "content": str(prompt)}
-                ],
+
+            response = await self._ds_client.chat.completions.create(
+                model=self.ds_name,
+                messages=messages,
                 max_tokens=4000,
                 temperature=0.2,
                 response_format={'type': 'json_object'}
             )
-            
+
             # The response object contains the content in the message field
             return response.choices[0].message.content
-            
+
         except Exception as e:
-            print(f"DeepSeek Failed: {e}")
-            print("Trying OpenAI...")
-            
+            logger.warning("DeepSeek failed, trying OpenAI: %s", e)
+
             try:
-                openai_api_key = os.getenv("OPENAI_API_KEY")
-                openai_api_model = os.getenv("OPENAI_API_MODEL")
-                
-                if not all([openai_api_key, openai_api_model]):
+                if self._oai_client is None:
                     raise ValueError("Missing OpenAI configuration environment variables")
-                
-                response = openai.OpenAI(
-                    api_key=openai_api_key,
-                ).chat.completions.create(
-                    model=openai_api_model,
-                    messages=[
-                        {"role": "system", "content": str(system_prompt)},
-                        {"role": "user", "content": str(prompt)}
-                    ],
+
+                response = await self._oai_client.chat.completions.create(
+                    model=self.openai_api_model,
+                    messages=messages,
                     max_tokens=4000,
                     temperature=0.2,
-                    response_format={'type': 'json_object'}
+                    response_format={'type': 'json_object'},
+                    extra_body={"prompt_cache_key": cache_key} if cache_key else None
                 )
-                
-                # Print for debugging
-                print(response.choices[0].message.content)
-                
+
+                logger.debug("OpenAI response: %s", response.choices[0].message.content)
+
                 # Return the raw JSON string
                 return response.choices[0].message.content
-                
+
             except Exception as e:
-                print(f"ALL LLMS FAILED: {e}")
-                raise ValueError(f"All LLM providers failed: {e}")
\ No newline at end of file
+                logger.error("All LLM providers failed: %s", e)
+                raise ValueError(f"All LLM providers failed: {e}")
@@ -1,75 +1,219 @@
 #ultis.py 
 
+import asyncio
 import docx2txt
-import PyPDF2
-import io
+import hashlib
+import logging
+import multiprocessing
+import pymupdf
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from fastapi.responses import StreamingResponse
+import numpy as np
 import pandas as pd
 
 from fastapi import HTTPException
 
-def extract_text(file_content, file_extension):
-    """Extract text from PDF or DOCX files."""
-    text = ""
+logger = logging.getLogger(__name__)
+
+# PyMuPDF extracts about 1 ms per page inline, and a warm pool adds about 10 ms of dispatch plus a copy
+# of the document per worker, so only long documents are worth splitting across processes
+PARALLEL_PDF_MIN_PAGES = 50
+PDF_WORKERS = min(os.cpu_count() or 1, 4)
+
+_pdf_pool = None
+
+
+def start_pdf_pool():
+    """Start the shared PDF extraction process pool; call once at app startup."""
+    global _pdf_pool
+    if _pdf_pool is None and PDF_WORKERS > 1:
+        # Spawn rather than fork: the app is already running threads
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        # Launch the workers now so no request waits for interpreters to start
+        _pdf_pool.submit(int)
+
+
+def shutdown_pdf_pool():
+    """Stop the shared PDF extraction process pool; call once at app shutdown."""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(cancel_futures=True)
+        _pdf_pool = None
+
+
+def _extract_pdf_pages(args):
+    """Extract the text of pages [start, stop) from a PDF; runs in a worker process."""
+    pdf_bytes, start, stop = args
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return "".join(doc[i].get_text() for i in range(start, stop))
+
+
+def extract_text_pdf(pdf_file):
+    """Extract text from a binary PDF file object, spreading large documents across worker processes."""
+    pdf_bytes = pdf_file.read()
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page_count = doc.page_count
+
+        pool = _pdf_pool
+        if pool is None or page_count < PARALLEL_PDF_MIN_PAGES:
+            return "".join(page.get_text() for page in doc)
+
+    # One contiguous page range per worker so the document is only sent once to each
+    step = -(-page_count // PDF_WORKERS)
+    ranges = [(pdf_bytes, start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    return "".join(pool.map(_extract_pdf_pages, ranges))
+
+
+def extract_text_docx(docx_file):
+    """Extract text from a binary DOCX file object."""
+    return docx2txt.process(docx_file)
+
+
+# Text extractors keyed by lowercase file extension
+_HANDLERS = {
+    ".pdf": extract_text_pdf,
+    ".docx": extract_text_docx,
+}
+
+
+def extract_text(file, file_extension):
+    """Extract text from PDF or DOCX files, given as a binary file object and a lowercase extension."""
     try:
-        if file_extension.lower() == ".pdf":
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-        elif file_extension.lower() == ".docx":
-            bytes_io = io.BytesIO(file_content)
-            text = docx2txt.process(bytes_io)
-        else:
+        handler = _HANDLERS.get(file_extension)
+        if handler is None:
             raise ValueError(f"Unsupported file format: {file_extension}")
-        return text
+        file.seek(0)
+        return handler(file)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error extracting text: {str(e)}")
 
 
+# Cap the number of uploads being read and parsed at once
+MAX_CONCURRENT_FILES = 16
+_file_semaphore = asyncio.Semaphore(MAX_CONCURRENT_FILES)
 
-async def process_files(files):
-        # Process all files upfront
-    processed_files = []
-    
-    for file in files:
-        # Check file extension
-        file_extension = "." + file.filename.split(".")[-1]
-        if file_extension.lower() not in [".pdf", ".docx"]:
-            raise HTTPException(status_code=400, detail=f"File {file.filename} is not a supported format. Only PDF and DOCX files are supported")
-        
+
+async def process_file(file, file_extension):
+    """Read one upload and extract its text without blocking the event loop."""
+    async with _file_semaphore:
         try:
-            # Read file content
-            file_content = await file.read()
-            
-            # Extract text from file
-            resume_text = extract_text(file_content, file_extension)
-            
+            # Extract text straight from the upload's spooled temporary file in a worker thread
+            resume_text = await asyncio.to_thread(extract_text, file.file, file_extension)
+
             # Extract filename as fallback name
             fallback_name = file.filename.rsplit(".", 1)[0]
-            
-            processed_files.append({
+
+            return {
                 "filename": file.filename,
                 "fallback_name": fallback_name,
                 "resume_text": resume_text
-            })
+            }
         except Exception as e:
-            print(f"Error processing file {file.filename}: {str(e)}")
+            logger.warning("Error processing file %s: %s", file.filename, e)
             # We could choose to add it with an error flag or skip it entirely
-            processed_files.append({
+            return {
                 "filename": file.filename,
                 "fallback_name": file.filename.rsplit(".", 1)[0],
                 "resume_text": "",
                 "error": f"Failed to process: {str(e)}"
-            })
+            }
+
+
+def _hash_file(file):
+    """Return the sha256 hex digest of a binary file object's contents."""
+    file.seek(0)
+    digest = hashlib.sha256()
+    while chunk := file.read(STREAM_CHUNK_SIZE):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+async def process_files(files):
+    # Validate every file before doing any work
+    file_extensions = []
+    for file in files:
+        # Check file extension
+        file_extension = "." + file.filename.split(".")[-1].lower()
+        if file_extension not in _HANDLERS:
+            raise HTTPException(status_code=400, detail=f"File {file.filename} is not a supported format. Only PDF and DOCX files are supported")
+        file_extensions.append(file_extension)
+
+    # Identical uploads are only parsed once
+    content_hashes = await asyncio.gather(*(asyncio.to_thread(_hash_file, file.file) for file in files))
+    first_upload = {}
+    for i, content_hash in enumerate(content_hashes):
+        first_upload.setdefault(content_hash, i)
+
+    # Read and parse the distinct files concurrently
+    parsed = await asyncio.gather(
+        *(process_file(files[i], file_extensions[i]) for i in first_upload.values())
+    )
+    parsed_by_hash = dict(zip(first_upload, parsed))
+
+    # Keep upload order, with each duplicate named after its own file
+    processed_files = []
+    for file, content_hash in zip(files, content_hashes):
+        processed_files.append({
+            **parsed_by_hash[content_hash],
+            "filename": file.filename,
+            "fallback_name": file.filename.rsplit(".", 1)[0],
+            "content_hash": content_hash
+        })
     return processed_files
 
+
+def _column_classes(columns, score_columns, justification_columns):
+    """Split report column indices into criterion score, total score and justification sets."""
+    score_columns, justification_columns = set(score_columns), set(justification_columns)
+    score_idx = frozenset(i for i, col in enumerate(columns) if col in score_columns)
+    total_idx = frozenset(i for i, col in enumerate(columns) if col == "Total Score")
+    just_idx = frozenset(i for i, col in enumerate(columns) if col in justification_columns)
+    return score_idx, total_idx, just_idx
+
+
+def _cell_values(column):
+    """Return a column's values as Python objects, with missing values as None so they are written blank."""
+    return column.astype(object).where(column.notna(), None).tolist()
+
+
+# Reports larger than this are spooled to disk instead of kept in memory
+EXCEL_SPOOL_MAX_SIZE = 4 << 20
+STREAM_CHUNK_SIZE = 65536
+
+
+async def _iter_file(file):
+    """Yield a file's contents in chunks, closing it once sent."""
+    try:
+        # Reads may hit disk once the report has spilled over, so keep them off the event loop
+        while chunk := await asyncio.to_thread(file.read, STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.close()
+
+
+def _column_widths(df, col_nums):
+    """Return the longest cell or header length plus padding of the given columns, in one vectorized pass."""
+    col_nums = list(col_nums)
+    header_lens = np.array([len(str(df.columns[i])) for i in col_nums], dtype=int)
+    if df.empty or not col_nums:
+        return dict(zip(col_nums, header_lens + 2))
+    cell_lens = np.char.str_len(df.iloc[:, col_nums].to_numpy().astype(str)).max(axis=0)
+    return dict(zip(col_nums, np.maximum(cell_lens, header_lens) + 2))
+
+
 def generate_excel_report(results):
     """
     Generate a formatted Excel report with summary and detailed analysis sheets.
     
     Args:
-        results (list): List of dictionaries containing score results for each candidate
+        results (list): List of dictionaries, one per candidate, each with "Candidate" and either
+            "scores" (list of criterion/score/justification dicts) and "Total Score", or "Error"
         
     Returns:
         StreamingResponse: Excel file as a streaming response
@@ -77,57 +221,69 @@ def generate_excel_report(results):
     Raises:
         HTTPException: If no valid results were generated or an error occurs
     """
+    output = None
     try:
         if not results:
             raise HTTPException(status_code=500, detail="No valid results were generated")
             
-        # First, reorganize the data to separate scores and justifications
-        summary_data = []
-        detailed_data = []
-        
-        for result in results:
-            if "Error" in result:
-                # Handle error cases
-                summary_row = {"Candidate": result["Candidate"], "Error": result["Error"]}
-                summary_data.append(summary_row)
-                detailed_data.append(result)
-                continue
-                
-            # Extract candidate name and total score
-            summary_row = {
-                "Candidate": result["Candidate"],
-                "Total Score": result.get("Total Score", 0)
-            }
-            
-            detailed_row = {
-                "Candidate": result["Candidate"]
-            }
-            
-            # Process each criterion - separate scores for summary and keep justifications for details
-            for key in result:
-                if "(Score)" in key:
-                    criterion = key.replace(" (Score)", "")
-                    summary_row[criterion] = result[key]
-                    
-                    # Add both score and justification to detailed row
-                    detailed_row[f"{criterion} - Score"] = result[key]
-                    justification_key = f"{criterion} (Justification)"
-                    if justification_key in result:
-                        detailed_row[f"{criterion} - Justification"] = result[justification_key]
-            
-            summary_data.append(summary_row)
-            detailed_data.append(detailed_row)
-        
-        # Create DataFrames
-        summary_df = pd.DataFrame(summary_data)
-        detailed_df = pd.DataFrame(detailed_data)
-        
+        # One row per candidate, in upload order
+        candidates = pd.DataFrame({
+            "Candidate": [result["Candidate"] for result in results],
+            "Total Score": [result.get("Total Score") for result in results],
+            "Error": [result.get("Error") for result in results],
+        })
+
+        # One row per (candidate, criterion) score, flattened by pandas
+        # The meta column is prefixed so a "row" key inside a score item cannot clash with it
+        records = pd.json_normalize(
+            [{"row": row, "scores": result["scores"]} for row, result in enumerate(results) if "Error" not in result],
+            record_path="scores",
+            meta=["row"],
+            meta_prefix="meta."
+        ).reindex(columns=["meta.row", "criterion", "score", "justification"]).rename(columns={"meta.row": "row"})
+        records = records.fillna({"criterion": "Unknown", "score": 0, "justification": ""})
+        records["criterion"] = records["criterion"].astype(str)
+        # A criterion repeated for one candidate keeps its last score
+        records = records.drop_duplicates(["row", "criterion"], keep="last")
+
+        # Criteria in order of first appearance, as columns
+        criteria_order = list(records["criterion"].unique())
+        scores = records.pivot(index="row", columns="criterion", values="score").reindex(
+            index=candidates.index, columns=criteria_order)
+        justifications = records.pivot(index="row", columns="criterion", values="justification").reindex(
+            index=candidates.index, columns=criteria_order)
+
+        has_scores = candidates["Error"].isna().any()
+        has_errors = candidates["Error"].notna().any()
+
+        # Summary: total and each criterion's score
+        summary_df = candidates[["Candidate", "Total Score"]] if has_scores else candidates[["Candidate"]]
+        # Criteria named like a fixed column get a suffix so the columns stay distinct
+        summary_scores = scores.rename(columns=lambda c: f"{c} (criterion)" if c in candidates.columns else c)
+        summary_df = summary_df.join(summary_scores)
+
+        # Detailed: each criterion's score next to its justification
+        detailed_df = pd.concat(
+            [candidates[["Candidate"]]] + [
+                pd.DataFrame({
+                    f"{criterion} - Score": scores[criterion],
+                    f"{criterion} - Justification": justifications[criterion],
+                })
+                for criterion in criteria_order
+            ],
+            axis=1
+        )
+
+        if has_errors:
+            summary_df = summary_df.assign(Error=candidates["Error"])
+            detailed_df = detailed_df.assign(Error=candidates["Error"])
+
         # Sort by total score (descending)
         if "Total Score" in summary_df.columns:
             summary_df = summary_df.sort_values("Total Score", ascending=False)
-            
-        # Create Excel in memory with multiple sheets
-        output = io.BytesIO()
+
+        # Create Excel with multiple sheets, spilling to disk if the workbook grows large
+        output = tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_MAX_SIZE)
         with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
             # Add summary sheet
             summary_df.to_excel(writer, sheet_name="Summary Scores", index=False)
@@ -165,73 +321,70 @@ def generate_excel_report(results):
                 'border': 1,
             })
             
-            # Format summary sheet
-            summary_sheet = writer.sheets["Summary Scores"]
-            
-            # Format headers
-            for col_num, value in enumerate(summary_df.columns.values):
-                summary_sheet.write(0, col_num, value, header_format)
-                
-            # Format data
-            for row_num in range(len(summary_df)):
-                summary_sheet.write(row_num + 1, 0, summary_df.iloc[row_num, 0], candidate_format)
-                
-                for col_num in range(1, len(summary_df.columns)):
-                    cell_value = summary_df.iloc[row_num, col_num]
-                    if isinstance(cell_value, (int, float)) and "Score" in summary_df.columns[col_num]:
-                        summary_sheet.write(row_num + 1, col_num, cell_value, score_format)
-                    else:
-                        summary_sheet.write(row_num + 1, col_num, cell_value)
-            
-            # Format detailed sheet
-            detailed_sheet = writer.sheets["Detailed Analysis"]
-            
-            # Format headers
-            for col_num, value in enumerate(detailed_df.columns.values):
-                detailed_sheet.write(0, col_num, value, header_format)
-                
-            # Format data
-            for row_num in range(len(detailed_df)):
-                detailed_sheet.write(row_num + 1, 0, detailed_df.iloc[row_num, 0], candidate_format)
-                
-                for col_num in range(1, len(detailed_df.columns)):
-                    cell_value = detailed_df.iloc[row_num, col_num]
-                    if isinstance(cell_value, (int, float)) and "Score" in detailed_df.columns[col_num]:
-                        detailed_sheet.write(row_num + 1, col_num, cell_value, score_format)
-                    elif "Justification" in detailed_df.columns[col_num]:
-                        detailed_sheet.write(row_num + 1, col_num, cell_value, justification_format)
-                    else:
-                        detailed_sheet.write(row_num + 1, col_num, cell_value)
-            
-            # Auto-adjust column widths
-            for sheet in [summary_sheet, detailed_sheet]:
-                for i, col in enumerate(sheet._df.columns if hasattr(sheet, '_df') else []):
-                    # Set fixed width for score columns and wider for justification
-                    if "Score" in col and "Total" not in col:
-                        sheet.set_column(i, i, 10)
-                    elif "Justification" in col:
-                        sheet.set_column(i, i, 40)
-                    elif col == "Candidate":
-                        sheet.set_column(i, i, 20)
+            # Criterion columns per sheet, as (score columns, justification columns)
+            sheets = [
+                ("Summary Scores", summary_df, summary_scores.columns, ()),
+                ("Detailed Analysis", detailed_df,
+                 [f"{criterion} - Score" for criterion in criteria_order],
+                 [f"{criterion} - Justification" for criterion in criteria_order]),
+            ]
+            for sheet_name, df, score_columns, justification_columns in sheets:
+                sheet = writer.sheets[sheet_name]
+
+                # Format headers
+                for col_num, value in enumerate(df.columns.values):
+                    sheet.write(0, col_num, value, header_format)
+
+                score_idx, total_idx, just_idx = _column_classes(df.columns, score_columns, justification_columns)
+                # Only columns without a fixed width need their contents measured
+                widths = _column_widths(df, (
+                    col_num for col_num in range(len(df.columns))
+                    if col_num not in just_idx and col_num not in score_idx and df.columns[col_num] != "Candidate"
+                ))
+
+                for col_num in range(len(df.columns)):
+                    if col_num in just_idx:
+                        sheet.set_column(col_num, col_num, 40)
+                        cell_format = justification_format
+                    elif col_num in score_idx:
+                        sheet.set_column(col_num, col_num, 10)
+                        cell_format = score_format
+                    elif df.columns[col_num] == "Candidate":
+                        sheet.set_column(col_num, col_num, 20)
+                        cell_format = candidate_format
                     else:
-                        # Dynamically size other columns
-                        max_len = max(
-                            sheet._df[col].astype(str).map(len).max() if hasattr(sheet, '_df') else 0,
-                            len(str(col))
-                        ) + 2
-                        sheet.set_column(i, i, min(max_len, 30))  # Cap width at 30 characters
-                        
-            # Freeze the header row
-            summary_sheet.freeze_panes(1, 0)
-            detailed_sheet.freeze_panes(1, 0)
+                        # Dynamically size other columns, capped at 30 characters
+                        sheet.set_column(col_num, col_num, min(int(widths[col_num]), 30))
+                        cell_format = score_format if col_num in total_idx else None
+
+                    if not len(df):
+                        continue
+
+                    # Style only the data rows, so the empty rows below stay unformatted
+                    if cell_format is not None:
+                        sheet.write_column(1, col_num, _cell_values(df.iloc[:, col_num]), cell_format)
+
+                    # Shade criterion scores from red (0) to green (5)
+                    if col_num in score_idx:
+                        sheet.conditional_format(1, col_num, len(df), col_num, {
+                            'type': '3_color_scale',
+                            'min_type': 'num', 'min_value': 0, 'min_color': '#F8696B',
+                            'mid_type': 'num', 'mid_value': 2.5, 'mid_color': '#FFEB84',
+                            'max_type': 'num', 'max_value': 5, 'max_color': '#63BE7B',
+                        })
+
+                # Freeze the header row
+                sheet.freeze_panes(1, 0)
         
         output.seek(0)
         
         # Return Excel file
         return StreamingResponse(
-            output,
+            _iter_file(output),
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             headers={"Content-Disposition": "attachment; filename=resume_scores.xlsx"}
         )
     except Exception as e:
+        if output is not None:
+            output.close()
         raise HTTPException(status_code=500, detail=f"Error generating Excel file: {str(e)}")
\ No newline at end of file